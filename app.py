@@ -1,9 +1,20 @@
 from flask import Flask, request, jsonify
 import os
+import tempfile
+from redis import Redis
+from rq import Queue
 from pdf_question_extractor import PDFQuestionExtractor
 
 app = Flask(__name__)
 
+# PDFs are processed by RQ workers, run `rq worker` next to the app. RQ's default
+# worker needs fork, on Windows run `rq worker --worker-class rq.SimpleWorker` instead.
+queue = Queue(connection=Redis())
+# OCR of long scanned PDFs can take several minutes
+JOB_TIMEOUT = 30 * 60
+# Uploads wait here for a worker, which deletes them once processed
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+
 @app.route("/", methods=["GET"])
 def index():
     with open("deploy.html") as f:
@@ -19,26 +30,38 @@ def upload():
     if not file or file.filename == "":
         return jsonify({"success": False, "error": "No PDF file uploaded."}), 400
 
-    # Save uploaded file
-    os.makedirs("uploads", exist_ok=True)
-    filepath = os.path.join("uploads", file.filename)
-    file.save(filepath)
-
-    # Initialize extractor with provided keys
-    extractor = PDFQuestionExtractor(
-        airtable_api_key=airtable_key,
-        airtable_base_id=airtable_base
-    )
-
-    # Process PDF
-    result = extractor.process_pdf(filepath)
-    os.remove(filepath)
-
-    response = {
-        "success": result.get("success", False),
-        "message": result.get("message", ""),
-        "error": result.get("error", "")
-    }
+    # Stream the upload to a unique file in chunks, workers only get its path
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    fd, filepath = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_DIR)
+    with os.fdopen(fd, "wb") as f:
+        file.save(f)
+
+    # Process PDF in the background
+    try:
+        job = queue.enqueue(PDFQuestionExtractor.process_pdf_task, filepath, airtable_key, airtable_base,
+                            job_timeout=JOB_TIMEOUT)
+    except Exception:
+        os.remove(filepath)
+        raise
+    return jsonify({"success": True, "job_id": job.id}), 202
+
+@app.route("/status/<job_id>", methods=["GET"])
+def status(job_id):
+    job = queue.fetch_job(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job id."}), 404
+
+    job_status = job.get_status()
+    response = {"status": job_status}
+    if job_status == "finished":
+        result = job.result or {}
+        response.update({
+            "success": result.get("success", False),
+            "message": result.get("message", ""),
+            "error": result.get("error", "")
+        })
+    elif job_status in ("failed", "stopped", "canceled"):
+        response.update({"success": False, "error": f"Processing {job_status}."})
     return jsonify(response)
 
 @app.errorhandler(400)
@@ -1,14 +1,159 @@
 import PyPDF2
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+import hashlib
+import importlib.util
 import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
-from PIL import Image
+from PIL import Image, ImageOps
 import pytesseract
 import pdf2image
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
 # Configure Tesseract path
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+# Render pages for OCR at this resolution; raise to 300 for very small fonts
+OCR_DPI = 150
+# Grayscale level above which a pixel is treated as paper when binarizing
+OCR_BINARIZE_THRESHOLD = 180
+
+# Pages whose text layer has fewer characters than this are OCRed
+OCR_THRESHOLD = 40
+
+# Airtable accepts at most 10 records per request and 5 requests per second per base
+AIRTABLE_BATCH_SIZE = 10
+AIRTABLE_MAX_WORKERS = 5
+AIRTABLE_REQUESTS_PER_SECOND = 5
+# Airtable asks clients to wait 30 seconds after a 429 response
+AIRTABLE_RETRY_DELAY = 30
+AIRTABLE_MAX_RETRIES = 2
+AIRTABLE_POOL_SIZE = 10
+
+# Extracted text is cached here, keyed by a hash of the PDF's content and the
+# extraction settings; least recently used entries beyond the limit are evicted
+TEXT_CACHE_DIR = os.path.join(os.path.dirname(__file__), "text_cache")
+TEXT_CACHE_MAX_FILES = 500
+# Bump when extraction changes in a way _text_cache_tag doesn't capture
+TEXT_CACHE_VERSION = 1
+
+# RAM-backed directory for the temp files pytesseract needs
+_RAM_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# tesserocr is only imported inside OCR workers, see _init_ocr_worker
+_HAS_TESSEROCR = importlib.util.find_spec("tesserocr") is not None
+
+# Tesseract API owned by the current OCR worker process (never shared)
+_tess_api = None
+_tess_error = None
+
+def _init_ocr_worker():
+    """Keep Tesseract single-threaded so pool workers don't oversubscribe cores"""
+    global _tess_api, _tess_error
+    # OpenMP reads this when libtesseract is loaded, so set it before importing tesserocr
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    # pytesseract round-trips every image through temp files
+    if _RAM_TEMP_DIR is not None:
+        tempfile.tempdir = _RAM_TEMP_DIR
+    if _HAS_TESSEROCR:
+        import tesserocr
+        try:
+            _tess_api = tesserocr.PyTessBaseAPI(psm=tesserocr.PSM.AUTO)
+        except RuntimeError as e:
+            # Reported by _tesseract_version instead of breaking the pool
+            _tess_error = e
+
+def _prepare_for_ocr(img: Image.Image) -> Image.Image:
+    """Stretch contrast and binarize a grayscale page image"""
+    img = ImageOps.autocontrast(img.convert("L"))
+    return img.point(lambda p: 0 if p < OCR_BINARIZE_THRESHOLD else 255, mode='1')
+
+def _ocr_image(img) -> str:
+    img = _prepare_for_ocr(img)
+    if _tess_api is not None:
+        _tess_api.SetImage(img)
+        return _tess_api.GetUTF8Text()
+    return pytesseract.image_to_string(img)
+
+def _page_runs(pages: list) -> list:
+    """Group sorted page indices into [first, last] runs of consecutive pages"""
+    runs = []
+    for i in pages:
+        if runs and runs[-1][1] == i - 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return runs
+
+def _tesseract_version() -> str:
+    """Check that this OCR worker can run Tesseract, returning its version"""
+    if _tess_error is not None:
+        raise _tess_error
+    if _tess_api is not None:
+        return _tess_api.Version()
+    return str(pytesseract.get_tesseract_version())
+
+def _text_cache_tag() -> bytes:
+    """Identify the extraction backends and settings that produced cached text"""
+    backend = "pymupdf" if fitz is not None else "pypdf2"
+    ocr_engine = "tesserocr" if _HAS_TESSEROCR else "pytesseract"
+    return (f"v{TEXT_CACHE_VERSION}|{backend}|{ocr_engine}|dpi={OCR_DPI}"
+            f"|threshold={OCR_THRESHOLD}|binarize={OCR_BINARIZE_THRESHOLD}").encode()
+
+def _evict_text_cache():
+    """Delete the least recently used cache entries beyond TEXT_CACHE_MAX_FILES"""
+    entries = []
+    for entry in os.scandir(TEXT_CACHE_DIR):
+        if entry.name.endswith(".txt"):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+    if len(entries) <= TEXT_CACHE_MAX_FILES:
+        return
+    entries.sort()
+    for _, path in entries[:len(entries) - TEXT_CACHE_MAX_FILES]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already evicted by another worker
+            pass
+
+class _RateLimiter:
+    """Space out calls so that at most `rate` of them start each second"""
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+# One limiter per Airtable base. This only paces requests within this process,
+# several RQ workers can still exceed the limit together and rely on 429 retries.
+_airtable_rate_limiters = {}
+_airtable_rate_limiters_lock = threading.Lock()
+
+def _airtable_rate_limiter(airtable_base_id: str) -> _RateLimiter:
+    with _airtable_rate_limiters_lock:
+        if airtable_base_id not in _airtable_rate_limiters:
+            _airtable_rate_limiters[airtable_base_id] = _RateLimiter(AIRTABLE_REQUESTS_PER_SECOND)
+        return _airtable_rate_limiters[airtable_base_id]
+
 @dataclass
 class Question:
     question_text: str
@@ -22,65 +167,160 @@ class PDFQuestionExtractor:
         self.airtable_key = airtable_api_key
         self.airtable_base = airtable_base_id
         self.airtable_table = "Questions"  # Your Airtable table name
+        # Reuse connections to api.airtable.com for the extractor's lifetime
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=AIRTABLE_POOL_SIZE, pool_maxsize=AIRTABLE_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {self.airtable_key}",
+            "Content-Type": "application/json"
+        })
         
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF file, fallback to OCR if no text found"""
-        text = ""
-        # Try PyPDF2 first
+    def _extract_page_texts(self, pdf_path: str) -> list:
+        """Extract the embedded text layer of each page, one string per page"""
+        if fitz is not None:
+            with fitz.open(pdf_path) as doc:
+                return [page.get_text("text") for page in doc]
+        # Fall back to PyPDF2 when PyMuPDF is not installed
         with open(pdf_path, 'rb') as file:
             pdf_reader = PyPDF2.PdfReader(file)
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        # If no text found, use OCR
-        if not text.strip():
+            return [page.extract_text() or "" for page in pdf_reader.pages]
+
+    def extract_text_from_pdf(self, pdf_path: str) -> str:
+        """Extract text from PDF file, reusing cached text for identical files"""
+        hasher = hashlib.blake2b(_text_cache_tag())
+        with open(pdf_path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                hasher.update(chunk)
+        cache_path = os.path.join(TEXT_CACHE_DIR, f"{hasher.hexdigest()}.txt")
+        try:
+            with open(cache_path, encoding="utf-8") as file:
+                text = file.read()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"   Could not read cached text: {e}")
+        else:
+            # Mark the entry as recently used for eviction, best effort
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            print("   Using cached text")
+            return text
+        
+        text, complete = self._extract_text(pdf_path)
+        # Don't cache partial OCR results, Tesseract may work on the next upload
+        if complete:
+            self._write_text_cache(cache_path, text)
+        return text
+
+    def _write_text_cache(self, cache_path: str, text: str):
+        """Store extracted text in the cache; failures are reported but never raised"""
+        temp_path = None
+        try:
+            os.makedirs(TEXT_CACHE_DIR, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=TEXT_CACHE_DIR)
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(text)
+            os.replace(temp_path, cache_path)
+            temp_path = None
+            _evict_text_cache()
+        except OSError as e:
+            print(f"   Could not cache extracted text: {e}")
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _extract_text(self, pdf_path: str) -> tuple:
+        """Extract text from PDF, fallback to OCR for pages with little text.
+        Returns the text and whether every page needing OCR was OCRed."""
+        page_texts = self._extract_page_texts(pdf_path)
+        ocr_pages = [i for i, page_text in enumerate(page_texts)
+                     if len(page_text.strip()) < OCR_THRESHOLD]
+        has_text = any(page_text.strip() for page_text in page_texts)
+        complete = not ocr_pages
+        # Only rasterize and OCR the pages with little or no text layer
+        if ocr_pages:
             try:
                 # Path to local Poppler installation
                 poppler_path = os.path.join(os.path.dirname(__file__), "poppler", "poppler-24.08.0", "Library", "bin")
-                images = pdf2image.convert_from_path(pdf_path, poppler_path=poppler_path)
-                print(f"   Successfully converted PDF to {len(images)} images")
                 
-                # Check if Tesseract is available
-                try:
-                    # Test if tesseract is working
-                    test_result = pytesseract.get_tesseract_version()
-                    print(f"   Using Tesseract version: {test_result}")
-                except Exception as tesseract_error:
-                    print(f"   Tesseract not available: {tesseract_error}")
-                    return "OCR_NOT_AVAILABLE: Tesseract is not installed. Please install Tesseract OCR to extract text from image-based PDFs."
+                # Render each run of consecutive pages with a single poppler call. pdftoppm
+                # streams PPM through stdout, pdftocairo would go through a temp folder
+                images = []
+                for first, last in _page_runs(ocr_pages):
+                    images += pdf2image.convert_from_path(pdf_path, poppler_path=poppler_path,
+                                                          first_page=first + 1, last_page=last + 1,
+                                                          dpi=OCR_DPI, grayscale=True,
+                                                          thread_count=os.cpu_count())
+                print(f"   Successfully converted {len(images)} pages to images")
                 
-                ocr_text = ""
-                for i, img in enumerate(images, 1):
-                    print(f"   Processing page {i}/{len(images)} with OCR...")
-                    page_text = pytesseract.image_to_string(img)
-                    ocr_text += page_text + "\n"
-                print(f"   OCR completed. Extracted {len(ocr_text)} characters")
-                text = ocr_text
+                # OCR pages in parallel, one Tesseract instance per worker. Every worker loads
+                # the language data on startup, so don't start more than there are pages
+                max_workers = min(os.cpu_count() or 1, len(ocr_pages))
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_ocr_worker) as executor:
+                    # Check if Tesseract is available, inside a worker so it sees the worker's setup
+                    try:
+                        # Test if tesseract is working
+                        test_result = executor.submit(_tesseract_version).result()
+                        print(f"   Using Tesseract version: {test_result}")
+                    except Exception as tesseract_error:
+                        print(f"   Tesseract not available: {tesseract_error}")
+                        if has_text:
+                            return "".join(page_text + "\n" for page_text in page_texts if page_text), False
+                        return "OCR_NOT_AVAILABLE: Tesseract is not installed. Please install Tesseract OCR to extract text from image-based PDFs.", False
+                    
+                    print(f"   Processing {len(images)} pages with OCR...")
+                    ocr_texts = list(executor.map(_ocr_image, images))
+                for i, page_text in zip(ocr_pages, ocr_texts):
+                    # Keep a short text layer when OCR recovers less than it
+                    if len(page_text.strip()) > len(page_texts[i].strip()):
+                        page_texts[i] = page_text
+                print(f"   OCR completed. Extracted {sum(len(t) for t in ocr_texts)} characters")
+                complete = True
             except Exception as e:
                 print(f"OCR extraction failed: {e}")
-                return f"OCR_FAILED: {str(e)}"
-        return text
+                if not has_text:
+                    return f"OCR_FAILED: {str(e)}", False
+        return "".join(page_text + "\n" for page_text in page_texts if page_text), complete
 
-    def upload_raw_text_to_airtable(self, text: str) -> bool:
+    def _post_records(self, url: str, data: dict) -> bool:
+        body = orjson.dumps(data)
+        try:
+            for attempt in range(AIRTABLE_MAX_RETRIES + 1):
+                _airtable_rate_limiter(self.airtable_base).wait()
+                response = self.session.post(url, data=body)
+                if response.status_code == 429 and attempt < AIRTABLE_MAX_RETRIES:
+                    print(f"   Airtable rate limit hit, retrying in {AIRTABLE_RETRY_DELAY}s...")
+                    time.sleep(AIRTABLE_RETRY_DELAY)
+                    continue
+                response.raise_for_status()
+                return True
+        except requests.exceptions.RequestException as e:
+            print(f"Error uploading {len(data['records'])} records: {e}")
+            return False
+
+    def upload_records_to_airtable(self, records: list) -> bool:
+        """Upload records in batches of 10, posting batches concurrently"""
         url = f"https://api.airtable.com/v0/{self.airtable_base}/{self.airtable_table}"
-        headers = {
-            "Authorization": f"Bearer {self.airtable_key}",
-            "Content-Type": "application/json"
-        }
+        payloads = [{"records": records[i:i + AIRTABLE_BATCH_SIZE]}
+                    for i in range(0, len(records), AIRTABLE_BATCH_SIZE)]
+        if len(payloads) == 1:
+            return self._post_records(url, payloads[0])
+        with ThreadPoolExecutor(max_workers=AIRTABLE_MAX_WORKERS) as executor:
+            results = list(executor.map(lambda data: self._post_records(url, data), payloads))
+        return all(results)
+
+    def upload_raw_text_to_airtable(self, text: str) -> bool:
         record = {
             "fields": {
                 "Raw Text": text,
             }
         }
-        data = {"records": [record]}
-        try:
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
-            return True
-        except requests.exceptions.RequestException as e:
-            print(f"Error uploading raw text: {e}")
-            return False
+        return self.upload_records_to_airtable([record])
 
     def process_pdf(self, pdf_path: str) -> dict:
         print(f"Processing PDF: {pdf_path}")
@@ -97,6 +337,18 @@ class PDFQuestionExtractor:
         else:
             return {"success": False, "error": "Failed to upload to Airtable"}
 
+    @staticmethod
+    def process_pdf_task(pdf_path: str, airtable_api_key: str, airtable_base_id: str) -> dict:
+        """Background job entry point: process an uploaded PDF, then delete it"""
+        extractor = PDFQuestionExtractor(
+            airtable_api_key=airtable_api_key,
+            airtable_base_id=airtable_base_id
+        )
+        try:
+            return extractor.process_pdf(pdf_path)
+        finally:
+            os.remove(pdf_path)
+
 # Usage Example
 def main():
     AIRTABLE_API_KEY = "your-airtable-api-key"
@@ -116,4 +368,5 @@ if __name__ == "__main__":
     main()
 
 # Required packages installation:
-# pip install PyPDF2 requests pillow pytesseract pdf2image
\ No newline at end of file
+# pip install pymupdf PyPDF2 requests pillow pytesseract pdf2image orjson flask rq redis
+# Optional, for in-process OCR: pip install tesserocr
\ No newline at end of file